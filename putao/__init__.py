@@ -2,5 +2,16 @@
 # flake8: noqa
 """葡萄 (putao, grape): Poor man's UTAU."""
 
-from . import core, model, utau
+import importlib
+
 from .__version__ import __version__
+
+# these pull in numpy/pydub/pyworld, so they are only imported on first access.
+_SUBMODULES = ("core", "model", "utau")
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -8,14 +8,12 @@ import tempfile
 import time
 
 import click
-import coloredlogs
-
-from . import source, utau
-from .core import Config, Project
-from .resamplers import RESAMPLERS
 
 from .__version__ import __version__
 
+# putao's own modules pull in numpy/pydub/pyworld, which are slow to import.
+# so they are imported inside the commands that need them, and --help stays fast.
+
 _log = logging.getLogger("putao")
 
 click.option = functools.partial(click.option, show_default=True)  # type: ignore
@@ -83,6 +81,8 @@ class Checkbox:
 @click.group()
 @click.version_option(__version__)
 def cli():
+    import coloredlogs
+
     coloredlogs.install(fmt="%(levelname)s %(message)s", level="DEBUG", logger=_log)
 
 
@@ -98,6 +98,8 @@ def cli():
 def v_extract(zfile, target):
     """Extract the voicebank(s) in zfile."""
 
+    from . import utau
+
     with tempfile.TemporaryDirectory() as _tempdir:
         tempdir = pathlib.Path(_tempdir)
 
@@ -130,6 +132,9 @@ def v_extract(zfile, target):
 
 
 def _p_new(name):
+    from .core import Config
+    from .resamplers import RESAMPLERS
+
     click.echo(f"Creating new project '{name}'.")
 
     author = click.prompt("Author of project (your name)")
@@ -157,6 +162,8 @@ def _p_new(name):
 def p_new(name, output):
     """Create a new project through an interactive wizard."""
 
+    from .core import Project
+
     config = _p_new(name)
     config_path = output or pathlib.Path(".") / f"{name}.{EXT}"
 
@@ -171,6 +178,9 @@ def p_new(name, output):
 def p_render(proj_file, source_file, output):
     """Render a project/source file."""
 
+    from . import source
+    from .core import Project
+
     proj = Project.load(proj_file)
 
     if source_file:
@@ -8,7 +8,7 @@ import gzip
 import json
 import logging
 import pathlib
-from typing import Dict, IO, List, Optional, Union
+from typing import Dict, IO, Iterator, List, Optional, Union
 
 from pydub import AudioSegment
 
@@ -20,8 +20,45 @@ from .__version__ import __version__
 from .exceptions import TrackError, ProjectError
 
 _log = logging.getLogger("putao")
+
+# how much settled audio (in miliseconds) to accumulate before setting it aside when rendering a track.
+SETTLE_INTERVAL = 10000
+# how many notes to pitch at once when rendering a track.
+PITCH_WINDOW = 64
 #_pf = cProfile.Profile()
 
+
+def _slice(segment: AudioSegment, start: int, end: int, offset: int) -> AudioSegment:
+    """Slice the end of a track exactly as pydub would slice the whole track.
+    pydub rounds each cut to frames on its own, so slicing the end by (start - offset) can be a frame off.
+
+    Args:
+        segment: The end of the track.
+        start: Where to start slicing the track (in miliseconds).
+        end: Where to stop slicing the track (in miliseconds).
+        offset: How many frames of the track come before segment.
+
+    Returns:
+        The slice.
+    """
+
+    rate = segment.frame_rate
+    width = segment.frame_width
+    length = round(1000 * ((offset + segment.frame_count()) / rate))
+
+    # anything before offset is already set aside.
+    start = max(int(min(start, length) * rate / 1000.0) - offset, 0)
+    end = max(int(min(end, length) * rate / 1000.0) - offset, 0)
+
+    data = segment.raw_data[start * width : end * width]
+    missing = (end - start) - len(data) // width
+    if data and missing > 0:
+        # pad with silence, like pydub.
+        data += b"\0" * (missing * width)
+
+    return segment._spawn(data)
+
+
 @dataclass
 class Config:
     """A project's configuration.
@@ -31,12 +68,15 @@ class Config:
     resampler: The name of the resampler to use.
         Available resamplers are in the dictionary model.RESAMPLERS.
         If not given, defaults to 'WorldResampler'.
+    workers: How many worker processes the resampler may render with.
+        If not given, everything is rendered in this process.
     """
 
     name: str = ""
     author: str = ""
     voicebank: str = "."
     resampler: str = "world"
+    workers: Optional[int] = None
     version: str = __version__
 
 
@@ -72,6 +112,48 @@ class Track:
         """
         self.notes.append(model.Rest(duration))
 
+    def _pitch(self) -> Iterator[Optional[AudioSegment]]:
+        # Pitch the notes a window at a time, so the resampler can share work between them
+        # without holding every render in memory at once.
+        # Yields the pitched audio for each note, or None if it doesn't need to be pitched.
+        for start in range(0, len(self.notes), PITCH_WINDOW):
+            window = self.notes[start : start + PITCH_WINDOW]
+
+            # rests and notes that are already sliced don't need to be pitched.
+            todo = [
+                not note.is_rest()
+                and (note.syllable, note.pitch) not in self.resampler.slices
+                for note in window
+            ]
+
+            if not any(todo):
+                yield from [None] * len(window)
+                continue
+
+            try:
+                pitched = iter(
+                    self.resampler.pitch_batch(
+                        [note for note, pitch in zip(window, todo) if pitch]
+                    )
+                )
+
+            except Exception as e:
+                # pitch the notes one by one to find the one that failed.
+                for count, (note, pitch) in enumerate(zip(window, todo), start=start + 1):
+                    if not pitch:
+                        continue
+
+                    try:
+                        self.resampler.pitch(note)
+                    except Exception:
+                        _log.critical(f"[track] failed to render note {count} ({note})!!!")
+                        break
+
+                raise e
+
+            for pitch in todo:
+                yield next(pitched) if pitch else None
+
     def render(self) -> AudioSegment:
         """Render all notes sequentially to an audio segment.
 
@@ -82,8 +164,20 @@ class Track:
         total = len(self.notes)
         timestamp = 0
 
+        # Audio more than one preutterance behind the timestamp can't be changed by later notes,
+        # so it is set aside to keep the render being spliced (and copied) for every note short.
+        settled: List[AudioSegment] = []
+        # how many frames of the track are set aside before track_render.
+        offset = 0
+        max_preutterance = max(
+            (entry.preutterance for entry in self.resampler.voicebank.values()),
+            default=0,
+        )
+
         #_pf.enable()
 
+        pitched = self._pitch()
+
         for count, note in enumerate(self.notes, start=1):
             _log.debug(
                 "[track:%ss] rendering note %s of %s",
@@ -93,14 +187,14 @@ class Track:
             )
 
             try:
-                render = self.resampler.render(note)
+                render = self.resampler.render(note, next(pitched))
 
             except Exception as e:
                 _log.critical(f"[track] failed to render note {count} ({note})!!!")
                 raise e
 
             # set CD-quality sample rate
-            render = render.set_frame_rate(utils.SAMPLE_RATE)
+            render = utils.resample(render, utils.SAMPLE_RATE)
 
             if note.is_rest():
                 track_render += render
@@ -115,7 +209,7 @@ class Track:
                     track_render += AudioSegment.silent(-start)
                     start = 0
 
-                overlap = track_render[start:timestamp]
+                overlap = _slice(track_render, start, timestamp, offset)
                 # keep the audio only up to overlap and slience the rest.
                 preutter = overlap[: entry.overlap] + AudioSegment.silent(
                     len(overlap) - entry.overlap
@@ -128,14 +222,22 @@ class Track:
                 # Truncate everything after start and append:
                 # - preutterance (overlapped with previous audio)
                 # - postutterance (everything after preutterance)
-                track_render = track_render[:start] + preutter + postutter
+                track_render = _slice(track_render, 0, start, offset) + preutter + postutter
 
                 timestamp += len(postutter)
 
+            boundary = int(
+                track_render.frame_count(ms=timestamp - max_preutterance)
+            ) - offset
+            if boundary >= track_render.frame_count(ms=SETTLE_INTERVAL):
+                settled.append(track_render.get_sample_slice(0, boundary))
+                track_render = track_render.get_sample_slice(boundary)
+                offset += boundary
+
         #_pf.disable()
         #_pf.print_stats(sort="time")
 
-        return track_render
+        return utils.join(settled + [track_render])
 
 
 class Project(c_abc.MutableMapping):
@@ -180,7 +282,7 @@ class Project(c_abc.MutableMapping):
         except KeyError:
             raise ProjectError(f"resampler {self.config.resampler} does not exist")
 
-        self.resampler = cls(self.voicebank)
+        self.resampler = cls(self.voicebank, workers=self.config.workers)
 
         for name, notes in (tracks or {}).items():
             track = self.new_track(name)
@@ -232,17 +334,22 @@ class Project(c_abc.MutableMapping):
         """
 
         project_render = AudioSegment.empty()
-        for name, track in self.tracks.items():
-            _log.info("[project] rendering track %s", name)
-            render = track.render()
+        try:
+            for name, track in self.tracks.items():
+                _log.info("[project] rendering track %s", name)
+                render = track.render()
+
+                project_len = len(project_render)
+                render_len = len(render)
 
-            project_len = len(project_render)
-            render_len = len(render)
+                if project_len < render_len:
+                    project_render += AudioSegment.silent(render_len - project_len)
 
-            if project_len < render_len:
-                project_render += AudioSegment.silent(render_len - project_len)
+                project_render = project_render.overlay(render)
 
-            project_render = project_render.overlay(render)
+        finally:
+            # don't leave worker processes running once the project is rendered.
+            self.resampler.close()
 
         project_render.export(path, format="wav")
 
@@ -3,15 +3,18 @@
 
 import abc
 import logging
-from typing import Tuple
+from typing import List, Optional, Tuple
 
 from pydub import AudioSegment, effects  # noqa
 
-from . import utau
+from . import utau, utils
 from .jsonclasses import dataclass
 
 _log = logging.getLogger("putao")
 
+# how many sliced renders to keep in memory at once.
+SLICE_CACHE_SIZE = 256
+
 
 @dataclass
 class Note:
@@ -42,18 +45,30 @@ class Resampler(abc.ABC):
 
     Args:
         voicebank: The voicebank to render with.
+        workers: How many worker processes the resampler may render with.
+            Resamplers that render in one process ignore this.
 
     Attributes:
         voicebank: See args.
+        workers: See args.
+        slices: Sliced renders, keyed by (syllable, pitch).
+            Songs repeat the same syllables, so each one is only pitched and sliced once.
     """
 
-    def __init__(self, voicebank: utau.Voicebank):
+    def __init__(self, voicebank: utau.Voicebank, workers: Optional[int] = None):
         self.voicebank = voicebank
+        self.workers = workers
+        self.slices = utils.LRUCache(SLICE_CACHE_SIZE)
 
     @property
     def name(self):
         return self.__class__.__name__
 
+    def close(self):
+        """Release anything the resampler holds on to between renders (i.e worker processes).
+        The resampler can still be used afterwards.
+        """
+
     @abc.abstractmethod
     def pitch(self, note: Note) -> AudioSegment:
         """Pitch the note.
@@ -66,6 +81,27 @@ class Resampler(abc.ABC):
             An AudioSegment of the pitched note.
         """
 
+    def pitch_batch(self, notes: List[Note]) -> List[AudioSegment]:
+        """Pitch several notes at once.
+        By default, each distinct (syllable, pitch) is pitched once, in turn:
+        resamplers that can share more work between notes should override this.
+
+        Args:
+            notes: The notes to pitch.
+
+        Returns:
+            A list of AudioSegments of the pitched notes, in the same order as notes.
+        """
+
+        # the same syllable at the same pitch always sounds the same.
+        pitched = {}
+        for note in notes:
+            key = (note.syllable, note.pitch)
+            if key not in pitched:
+                pitched[key] = self.pitch(note)
+
+        return [pitched[note.syllable, note.pitch] for note in notes]
+
     def slice(
         self, note: Note, audio: AudioSegment
     ) -> Tuple[AudioSegment, AudioSegment]:
@@ -137,12 +173,14 @@ class Resampler(abc.ABC):
 
         return render
 
-    def render(self, note: Note) -> AudioSegment:
+    def render(self, note: Note, audio: Optional[AudioSegment] = None) -> AudioSegment:
         """Render a note.
         The note is pitched, then sliced and stretched to create the render.
 
         Args:
             note: The note to render.
+            audio: The already pitched note (i.e from .pitch_batch()).
+                If not given, the note is pitched here.
 
         Returns:
             The rendered note.
@@ -151,5 +189,15 @@ class Resampler(abc.ABC):
         if note.is_rest():
             return AudioSegment.silent(note.duration)
 
-        consonant, vowel = self.slice(note, self.pitch(note))
+        key = (note.syllable, note.pitch)
+
+        sliced = self.slices.get(key)
+        if sliced is None:
+            if audio is None:
+                audio = self.pitch(note)
+
+            sliced = self.slice(note, audio)
+            self.slices.put(key, sliced)
+
+        consonant, vowel = sliced
         return self.stretch(consonant, vowel, note)
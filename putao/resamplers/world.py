@@ -2,9 +2,12 @@
 
 from __future__ import annotations
 
+import collections
+import concurrent.futures as futures
 import logging
 import pathlib
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import List, Optional
 
 import numpy as np
 import pyworld
@@ -19,6 +22,12 @@ _log = logging.getLogger("putao")
 # **NOT** compatible with other resamplers!
 EXTENSION = ".world.npz"
 
+# how many wavfiles' analyses to keep in memory at once (spectral envelopes are large).
+FRQ_CACHE_SIZE = 64
+
+# how many pitched samples to keep in memory at once.
+RENDER_CACHE_SIZE = 256
+
 
 @dataclass
 class Frq:
@@ -26,6 +35,16 @@ class Frq:
     sp: np.ndarray
     ap: np.ndarray
 
+    # derived from f0 once, instead of for every batch of notes.
+    voiced: np.ndarray = field(init=False, repr=False)
+    average: float = field(init=False)
+
+    def __post_init__(self):
+        # estimate pitch
+        # get rid of zero values, average will be much less accurate.
+        self.voiced = self.f0 > 0
+        self.average = float(np.average(self.f0[self.voiced]))
+
     @classmethod
     def load(cls, wavfile: str) -> Frq:
         path = pathlib.Path(wavfile).with_suffix(EXTENSION)
@@ -40,47 +59,137 @@ class Frq:
             if not f0.nonzero()[0].size:
                 raise RuntimeError(f"f0 estimation failed for {wavfile}!!!")
 
-            data = {"f0": f0, "sp": sp, "ap": ap}
+            # the spectral envelope and aperiodicity are by far the largest arrays.
+            # single precision is plenty for them, and halves their size.
+            data = {"f0": f0, "sp": sp.astype(np.float32), "ap": ap.astype(np.float32)}
 
             np.savez(path, **data)
 
-        return cls(**data)
+        # analyses saved by older versions are still float64.
+        return cls(
+            data["f0"],
+            data["sp"].astype(np.float32, copy=False),
+            data["ap"].astype(np.float32, copy=False),
+        )
+
+
+def _synthesize(frq: Frq, pitches: List[int], sr: int) -> List[np.ndarray]:
+    note_hz = utils.midi_to_hz(pitches)
+
+    # add the difference, as one row of f0 per pitch.
+    # the sum is written straight into the output, and unvoiced frames stay zero.
+    f0s = np.zeros((len(pitches), len(frq.f0)))
+    np.add(frq.f0, (note_hz - frq.average)[:, None], out=f0s, where=frq.voiced)
+
+    # pyworld only synthesizes from float64.
+    sp = frq.sp.astype(np.float64)
+    ap = frq.ap.astype(np.float64)
+
+    # FIXME: some singing noises are grazed
+    # i.e _い.wav (in teto voicebank).
+    # https://github.com/JeremyCCHsu/Python-Wrapper-for-World-Vocoder/issues/61
+    return [pyworld.synthesize(f0, sp, ap, sr) for f0 in f0s]
+
+
+def _synthesize_wav(wav: str, pitches: List[int]) -> List[np.ndarray]:
+    # runs in a worker process, so the frq is loaded (or analysed) here.
+    # only the synthesized audio has to be sent back.
+    return _synthesize(Frq.load(wav), pitches, utils.srate(wav))
 
 
 class Resampler(model.Resampler):
+    """A resampler that pitches samples with the WORLD vocoder.
+
+    Args:
+        voicebank: The voicebank to render with.
+        workers: If given, wavfiles that aren't analysed in memory yet are synthesized
+            across this many worker processes.
+            WORLD holds the GIL, so threads wouldn't help.
+            On platforms that spawn processes (Windows, macOS),
+            the calling script must be guarded by 'if __name__ == "__main__"'.
+            Defaults to None (everything is synthesized in this process).
+    """
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+        # created on first use, and reused for the lifetime of the resampler.
+        self._executor: Optional[futures.ProcessPoolExecutor] = None
+
         # frq files are lazily generated
-        self.cache = {}
+        self.cache = utils.LRUCache(FRQ_CACHE_SIZE)
+        # pitched samples, keyed by (wavfile, semitone).
+        # AudioSegments are immutable, so renders can be shared between notes.
+        self.renders = utils.LRUCache(RENDER_CACHE_SIZE)
 
     def frq(self, wav):
-        if wav not in self.cache:
-            self.cache[wav] = Frq.load(wav)
+        frq = self.cache.get(wav)
 
-        return self.cache[wav]
+        if frq is None:
+            frq = Frq.load(wav)
+            self.cache.put(wav, frq)
 
-    def pitch(self, note):
-        entry = self.voicebank[note.syllable]
+        return frq
 
-        frq = self.frq(entry.wav)
-        sr = utils.srate(entry.wav)
+    def close(self):
+        """Shut down the worker processes, if any were started."""
 
-        # estimate pitch
-        # get rid of zero values, average will be much less accurate.
-        hz = np.average(frq.f0[frq.f0.nonzero()])
-
-        p = utils.Pitch()
-        p.midi = note.pitch
-        note_hz = p.hz
-
-        # add the difference
-        frq.f0[frq.f0.nonzero()] += note_hz - hz
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
 
-        # _log.debug(f"pitching note ({note_hz}hz, semitone {note.pitch})")
-
-        # FIXME: some singing noises are grazed
-        # i.e _い.wav (in teto voicebank).
-        # https://github.com/JeremyCCHsu/Python-Wrapper-for-World-Vocoder/issues/61
-        arr = pyworld.synthesize(frq.f0, frq.sp, frq.ap, sr)
-        return utils.arr2seg(arr, sr)
+    def pitch(self, note):
+        return self.pitch_batch([note])[0]
+
+    def pitch_batch(self, notes):
+        # renders for this batch, so none of them are evicted before being returned.
+        pitched = {}
+
+        # group notes by wavfile, so each sample is shifted once for all of its notes.
+        groups = collections.defaultdict(set)
+        for note in notes:
+            key = (self.voicebank[note.syllable].wav, note.pitch)
+
+            # the same syllable at the same pitch always synthesizes the same audio.
+            render = self.renders.get(key)
+            if render is None:
+                groups[key[0]].add(note.pitch)
+            else:
+                pitched[key] = render
+
+        groups = {wav: list(pitches) for wav, pitches in groups.items()}
+
+        # wavfiles already analysed in memory are cheap to synthesize here.
+        # only the rest are worth sending to worker processes.
+        uncached = [wav for wav in groups if wav not in self.cache]
+
+        remote = {}
+
+        if self.workers and len(uncached) > 1:
+            if self._executor is None:
+                self._executor = futures.ProcessPoolExecutor(self.workers)
+
+            # submitted now, so they run alongside the synthesis below.
+            remote = {
+                wav: self._executor.submit(_synthesize_wav, wav, groups[wav])
+                for wav in uncached
+            }
+
+        synthesized = {
+            wav: _synthesize(self.frq(wav), pitches, utils.srate(wav))
+            for wav, pitches in groups.items()
+            if wav not in remote
+        }
+        synthesized.update((wav, future.result()) for wav, future in remote.items())
+
+        for wav, pitches in groups.items():
+            arrs = synthesized[wav]
+            sr = utils.srate(wav)
+
+            for pitch, arr in zip(pitches, arrs):
+                pitched[wav, pitch] = utils.arr2seg(arr, sr)
+                self.renders.put((wav, pitch), pitched[wav, pitch])
+
+        return [
+            pitched[self.voicebank[note.syllable].wav, note.pitch] for note in notes
+        ]
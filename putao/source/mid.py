@@ -4,6 +4,7 @@ NOTE: If a note overlaps with the next, it will be truncated to the start of the
 """
 
 
+import collections
 import io
 from dataclasses import dataclass
 from typing import List
@@ -47,7 +48,6 @@ class Song:
     def parse(self):
 
         clock = 0
-        next_clock = 0
 
         meta = self.mid.tracks[0]
         meta_clock = 0
@@ -66,7 +66,10 @@ class Song:
             if msg.type == "set_tempo":
                 tempo.append((msg.tempo, meta_clock))
 
-        for count, msg in enumerate(lead):
+        # notes waiting for their note_off, by note number.
+        pending = collections.defaultdict(list)
+
+        for msg in lead:
             clock += msg.time
 
             current_tempo = tempo[tempo_counter]
@@ -83,62 +86,52 @@ class Song:
                     current_tempo = next_tempo
                     tempo_counter += 1
 
-            if msg.type == "note_on":
-                next_clock = clock
+            if msg.type == "note_on" and msg.velocity > 0:
+                # the end is filled in by the matching note_off.
+                event = Event(
+                    clock,
+                    clock,
+                    msg.note,
+                    self.mid.ticks_per_beat,
+                    current_tempo[0],
+                )
 
-                for next_count, next_msg in enumerate(lead[count + 1 :]):
-                    next_clock += next_msg.time
+                self.events.append(event)
+                pending[msg.note].append(event)
 
-                    if next_msg.type == "note_off" and next_msg.note == msg.note:
-                        break
+            elif msg.type in ("note_on", "note_off"):
+                # a note_on with no velocity is also a note_off.
+                for event in pending.pop(msg.note, ()):
+                    event.end = clock
 
-                self.events.append(
-                    Event(
-                        clock,
-                        next_clock,
-                        msg.note,
-                        self.mid.ticks_per_beat,
-                        current_tempo[0],
-                    )
-                )
+        # notes that are never turned off last until the end of the track.
+        for events in pending.values():
+            for event in events:
+                event.end = clock
 
     def dump(self):
         notes = []
 
-        for count, event in enumerate(self.events):
-            try:
-                next_event = self.events[count + 1]
-            except IndexError:
-                next_event = None
-
-            if next_event is not None:
-                rest = next_event.start - event.end
+        for event, next_event in zip(self.events, self.events[1:] + [None]):
+            rest = 0 if next_event is None else next_event.start - event.end
 
-                if rest == 0:
-                    # dump note verbatim.
-                    notes.append(event.dump())
-
-                elif rest > 0:
-                    notes.append(event.dump())
-
-                    # add a rest
-                    notes.append(
-                        {
-                            "type": "rest",
-                            "duration": int(
-                                mido.tick2second(rest, event.tpb, event.tempo) * 1000
-                            ),
-                        }
-                    )
-
-                elif rest < 0:
-                    # overlapping notes, truncate previous one
-                    event.end = next_event.start
-
-                    notes.append(event.dump())
+            if rest < 0:
+                # overlapping notes, truncate previous one
+                event.end = next_event.start
 
             notes.append(event.dump())
 
+            if rest > 0:
+                # add a rest
+                notes.append(
+                    {
+                        "type": "rest",
+                        "duration": int(
+                            mido.tick2second(rest, event.tpb, event.tempo) * 1000
+                        ),
+                    }
+                )
+
         return {"lead": notes}
 
 
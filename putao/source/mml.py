@@ -193,11 +193,10 @@ class Interpreter:
             raise ValueError(f"not enough phonemes in lyrics for note {token.loc}")
 
         # In mml, we use a 'global' octave so we have to calculate the semitone here.
-        p = utils.Pitch()
-        p.spn = key + str(track["octave"])
+        pitch = utils.Pitch.from_spn(key + str(track["octave"]))
         duration = utils.duration(length or track["length"], track["tempo"])
 
-        self.project[self.current_track].note(phoneme, p.midi, duration)
+        self.project[self.current_track].note(phoneme, pitch.midi, duration)
 
     def rest(self, token, track):
         length = token.value
@@ -5,22 +5,75 @@ NOTE: all time values are in miliseconds.
 
 from __future__ import annotations
 
+import codecs
 import collections.abc as c_abc
+import concurrent.futures as futures
+import functools
+import io
+import json
 import logging
+import os
 import pathlib
-import re
+import shutil
 import zipfile
-from dataclasses import dataclass
-from typing import Dict, Set, Union
+from dataclasses import dataclass, fields
+from typing import Dict, List, Set, Tuple, Union
 
-import chardet
+try:
+    # cchardet is a C implementation of chardet's interface, and much faster.
+    import cchardet as chardet
+except ImportError:
+    try:
+        # charset_normalizer is compiled too, and also provides chardet's detect().
+        import charset_normalizer as chardet
+    except ImportError:
+        import chardet
 
 _log = logging.getLogger("putao")
 
-RE_SYLLABLE = re.compile(r"(\w+\.wav)=(.+)" + (r",(-?\d+)" * 5))
-
 CONFIG_FILE = "oto.ini"
 JSON_CONFIG_FILE = "oto.json"
+# bump this whenever Entry.parse/dump changes, so stale caches of oto.ini are re-parsed.
+JSON_CONFIG_VERSION = 1
+
+# almost all voicebanks use one of these, so they are tried before detecting the encoding.
+ENCODINGS = ("sjis", "cp932", "utf8")
+
+# how much of a text file to read to guess its encoding when extracting.
+CHUNK_SIZE = 64 * 1024
+
+
+def _decode(raw: bytes) -> str:
+    if raw.isascii():
+        # nothing to re-encode.
+        return raw.decode("ascii")
+
+    for encoding in ENCODINGS:
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+
+    # use chardet to figure out encoding
+    encoding = chardet.detect(raw)["encoding"]
+    return raw.decode(encoding)
+
+
+def _detect_encoding(head: bytes) -> str:
+    # head may end partway through a character, so decode it incrementally.
+    for encoding in ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(head)
+        except UnicodeDecodeError:
+            continue
+
+        return encoding
+
+    return chardet.detect(head)["encoding"]
+
+
+# zipfiles repeat the same folder names in every path, so cache decoded path components.
+_decode_name = functools.lru_cache(maxsize=1024)(_decode)
 
 
 def unmojibake(text: Union[str, bytes]) -> str:
@@ -28,26 +81,22 @@ def unmojibake(text: Union[str, bytes]) -> str:
 
     Args:
         text: The text to re-encode.
+            If this is a str (i.e a zipfile filename), it is re-encoded one path component at a time.
 
     Returns:
         The UTF8-ified text.
     """
 
     if isinstance(text, str):
+        # '/' is never the trail byte of a Shift-JIS character, so it is safe to split on.
         raw = text.encode("cp437")
-    else:
-        # already bytes
-        raw = text
+        return "/".join(_decode_name(part) for part in raw.split(b"/"))
 
-    try:
-        return raw.decode("sjis")
-    except UnicodeDecodeError:
-        # use chardet to figure out encoding
-        encoding = chardet.detect(raw)["encoding"]
-        return raw.decode(encoding)
+    # already bytes
+    return _decode(text)
 
 
-@dataclass
+@dataclass(slots=True)
 class Entry:
     """An entry in the oto.ini config of an UTAU voicebank.
     (All time values are in miliseconds.)
@@ -87,33 +136,39 @@ class Entry:
         Returns:
             The entry object.
         """
-        try:
-            wav, alias, *times = RE_SYLLABLE.findall(entry)[0]
-            times = [int(t) for t in times]
-        except IndexError:
-            # oto has blank entries (only the filename is in the line)
-            wav = entry.split("=")[0]
-            alias = wav.split(".")[0]
-            times = [0, 0, 0, 0, 0]
+        # entries are 'wav=alias,offset,consonant,cutoff,preutterance,overlap'.
+        # the alias may contain commas, so split the times off from the right.
+        wav, _, rest = entry.strip().partition("=")
+        alias, *times = rest.rsplit(",", 5)
 
-        return cls(wav, alias, *times)
+        if alias and len(times) == 5:
+            try:
+                return cls(wav, alias, *map(int, times))
+            except ValueError:
+                pass
+
+        # oto has blank entries (only the filename is in the line)
+        return cls(wav, wav.split(".")[0], 0, 0, 0, 0, 0)
 
     @classmethod
     def load(cls, entry: dict) -> Entry:
         """Load an entry from its dict representation."""
-        new_entry = {
-            field: value if field in ("wav", "alias") else int(value)
-            for field, value in entry.items()
-        }
-
-        return cls(**new_entry)
+        return cls(
+            entry["wav"],
+            entry["alias"],
+            int(entry["offset"]),
+            int(entry["consonant"]),
+            int(entry["cutoff"]),
+            int(entry["preutterance"]),
+            int(entry["overlap"]),
+        )
 
     def path(self) -> pathlib.Path:
         return pathlib.Path(self.wav)
 
     def dump(self) -> dict:
         """Dump this entry to a dict representation."""
-        return self.__dict__.copy()
+        return {field.name: getattr(self, field.name) for field in fields(self)}
 
 
 def parse_oto(oto: Union[str, pathlib.Path], enc: str = "utf8") -> Dict[str, Entry]:
@@ -123,29 +178,44 @@ def parse_oto(oto: Union[str, pathlib.Path], enc: str = "utf8") -> Dict[str, Ent
         path: The path to the oto.ini file.
         enc: The encoding of the file.
             Most voicebanks are encoded in Shift-JIS, or very rarely UTF-8.
+            If the file can't be decoded with it, the encoding is guessed instead.
 
     Returns:
         A dict map of alias to an Entry object.
     """
 
     oto = pathlib.Path(oto)
-    oto_map = {}
 
-    # assuming the voicebank is already utf8...
-    with open(oto, encoding=enc) as f:
-        for _entry in f.readlines():
-            entry = Entry.parse(_entry)
-            oto_map[entry.alias] = entry
+    # decode the whole file in one go.
+    data = oto.read_bytes()
 
-            if not entry.consonant:
-                _log.warning(f"{entry.alias}: consonant length is zero")
+    try:
+        text = data.decode(enc)
+    except UnicodeDecodeError:
+        # the voicebank wasn't converted to utf8 (i.e extracted by something else).
+        text = unmojibake(data)
 
-            if not entry.overlap < entry.preutterance:
-                _log.warning(f"{entry.alias}: overlap ({entry.overlap}) should be before preutterance ({entry.preutterance})")
+    # lines without '=' are empty.
+    oto_map = {
+        (entry := Entry.parse(line)).alias: entry
+        for line in text.splitlines()
+        if "=" in line
+    }
+
+    _check_entries(oto_map)
 
     return oto_map
 
 
+def _check_entries(entries: Dict[str, Entry]):
+    for entry in entries.values():
+        if not entry.consonant:
+            _log.warning(f"{entry.alias}: consonant length is zero")
+
+        if not entry.overlap < entry.preutterance:
+            _log.warning(f"{entry.alias}: overlap ({entry.overlap}) should be before preutterance ({entry.preutterance})")
+
+
 class Voicebank(c_abc.Mapping):
     """An UTAU voicebank.
 
@@ -164,11 +234,7 @@ class Voicebank(c_abc.Mapping):
         self.entries: Dict[str, Entry]
         self.wavfiles: Set[str] = set()
 
-        _log.debug("parsing oto.ini")
-
-        self.entries = parse_oto(self.path / CONFIG_FILE)
-
-        _log.debug("parsed oto.ini")
+        self.entries = self._load_entries()
 
         # wavfiles should be in the same directory as the oto.ini file.
         # make the paths absolute
@@ -176,6 +242,55 @@ class Voicebank(c_abc.Mapping):
             entry.wav = str(self.path / entry.wav)
             self.wavfiles.add(entry.wav)
 
+    def _load_entries(self) -> Dict[str, Entry]:
+        # parsing oto.ini is slow for large voicebanks, so the parsed entries are cached to oto.json.
+        # the cache is invalidated whenever oto.ini is modified, or the cache format changes.
+        oto = self.path / CONFIG_FILE
+        oto_json = self.path / JSON_CONFIG_FILE
+
+        stat = oto.stat()
+        key = [JSON_CONFIG_VERSION, stat.st_mtime_ns, stat.st_size]
+
+        try:
+            with oto_json.open(encoding="utf8") as f:
+                cache = json.load(f)
+
+            if cache["key"] == key:
+                _log.debug("loading cached oto.ini")
+                entries = {
+                    alias: Entry.load(entry)
+                    for alias, entry in cache["entries"].items()
+                }
+
+                # warn about the same problems as parsing would.
+                _check_entries(entries)
+                return entries
+
+        except (OSError, ValueError, KeyError, TypeError):
+            # no cache, or it is corrupt.
+            pass
+
+        _log.debug("parsing oto.ini")
+
+        entries = parse_oto(oto)
+
+        _log.debug("parsed oto.ini")
+
+        cache = {
+            "key": key,
+            "entries": {alias: entry.dump() for alias, entry in entries.items()},
+        }
+
+        try:
+            with oto_json.open("w", encoding="utf8") as f:
+                json.dump(cache, f, ensure_ascii=False)
+
+        except OSError as e:
+            # i.e the voicebank folder is read-only.
+            _log.debug("could not cache oto.ini: %s", e)
+
+        return entries
+
     def __getitem__(self, key):
         return self.entries[key]
 
@@ -185,12 +300,75 @@ class Voicebank(c_abc.Mapping):
     def __len__(self):
         return len(self.entries)
 
+    # Mapping's defaults go through __getitem__ and catch KeyError, so hit the dict directly.
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        return self.entries.get(key, default)
+
 
 def is_utf8(zinfo: zipfile.ZipInfo) -> bool:
     """Check whether the filename of the zipinfo is utf8."""
     return bool(zinfo.flag_bits & 0x800)
 
 
+def _extract_text(
+    zf: zipfile.ZipFile,
+    zinfo: zipfile.ZipInfo,
+    full_path: pathlib.Path,
+    convert_newlines: bool,
+):
+    # guess the encoding from the start of the file, then stream the rest.
+    with zf.open(zinfo) as f:
+        encoding = _detect_encoding(f.read(CHUNK_SIZE))
+
+    # newline=None translates CRLF (and CR) to LF while reading.
+    newline = None if convert_newlines else ""
+
+    try:
+        with zf.open(zinfo) as f, io.TextIOWrapper(
+            f, encoding=encoding, newline=newline
+        ) as src, full_path.open("w", encoding="utf8", newline="") as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+    except UnicodeDecodeError:
+        # the start of the file was not representative, so decode it all at once.
+        text = unmojibake(zf.read(zinfo))
+
+        if convert_newlines:
+            # the same translation as newline=None above.
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+        full_path.write_text(text, encoding="utf8", newline="")
+
+
+def _extract_batch(
+    path: pathlib.Path,
+    to: pathlib.Path,
+    members: List[Tuple[int, str]],
+    convert_newlines: bool,
+):
+    with zipfile.ZipFile(path) as zf:
+        infolist = zf.infolist()
+
+        for index, filename in members:
+            zinfo = infolist[index]
+            zinfo.filename = filename
+
+            full_path = to / filename
+
+            # decode any text files and extract manually
+            if full_path.suffix[1:] in ("txt", "ini"):
+                _log.debug("re-encoding %s to UTF8", filename)
+                _extract_text(zf, zinfo, full_path, convert_newlines)
+
+            else:
+                _log.debug("extracting %s", filename)
+                zf.extract(zinfo, path=to)
+
+
 def extract(
     path: Union[str, pathlib.Path],
     to: Union[str, pathlib.Path],
@@ -201,32 +379,37 @@ def extract(
     Args:
         path: The path to the zipfile.
         to: The folder to extract the zipfile to.
-        convert_newlines: Whether or not to replace Windows-style newlines (CRLF) with *nix-style newlines (LF).
+        convert_newlines: Whether or not to replace Windows-style (CRLF) and old Mac-style (CR) newlines
+            with *nix-style newlines (LF).
             Defaults to True.
     """
     path = pathlib.Path(path)
     to = pathlib.Path(to)
 
+    members = []
+
     with zipfile.ZipFile(path) as zf:
-        for zinfo in zf.infolist():
+        for index, zinfo in enumerate(zf.infolist()):
+            filename = zinfo.filename
 
             if not is_utf8(zinfo):
                 # most voicebanks are either romanji (ASCII) or kanji/hirigana (SHIFT-JIS).
-                zinfo.filename = unmojibake(zinfo.filename)
+                filename = unmojibake(filename)
 
-            full_path = to / zinfo.filename
-            full_path.parent.mkdir(exist_ok=True)
+            # create folders up front, so workers don't race to make the same ones.
+            (to / filename).parent.mkdir(parents=True, exist_ok=True)
 
-            # decode any text files and extract manually
-            if full_path.suffix[1:] in ("txt", "ini"):
-                _log.debug("re-encoding %s to UTF8", zinfo.filename)
-                text = unmojibake(zf.read(zinfo))
-
-                if convert_newlines:
-                    text = text.replace("\r\n", "\n")
+            members.append((index, filename))
 
-                full_path.write_text(text, encoding="UTF8")
+    # zipfiles aren't safe to read from several threads, so each worker opens its own.
+    workers = min(os.cpu_count() or 1, len(members)) or 1
+    batches = [members[i::workers] for i in range(workers)]
 
-            else:
-                _log.debug("extracting %s", zinfo.filename)
-                zf.extract(zinfo, path=to)
+    with futures.ThreadPoolExecutor(workers) as executor:
+        # consume the results so exceptions from workers are raised here.
+        list(
+            executor.map(
+                lambda batch: _extract_batch(path, to, batch, convert_newlines),
+                batches,
+            )
+        )
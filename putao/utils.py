@@ -1,42 +1,84 @@
 # coding: utf8
 """Utility functions are kept here."""
 
+from __future__ import annotations
+
 import collections
+import functools
 import math
 import pathlib
-import re
 import wave
-from typing import Union
+from typing import Any, Hashable, List, Union
 
 import numpy as np
 import pyworld
+import soxr
 from pydub import AudioSegment
 
 from .exceptions import ConversionError
 
 SAMPLE_RATE = 44100
 
-RE_NOTE = re.compile(r"^((?i:[cdefgab]))([#b])?(\d+)$")
-
 _note_length = collections.namedtuple(
     "_note_length", "whole half quarter eighth sixteenth thirty_second sixty_fourth"
 )
 NOTE_LENGTH = _note_length(1, 2, 4, 8, 16, 32, 64)
 
-KEYS = ["c", "c#", "d", "d#", "e", "f", "f#", "g", "g#", "a", "a#", "b"]
+KEYS = ("c", "c#", "d", "d#", "e", "f", "f#", "g", "g#", "a", "a#", "b")
+
+# semitones from C of each key, with and without an accidental.
+_KEY_SEMITONES = {
+    f"{key}{accidental}": semitone + offset
+    for semitone, key in enumerate(KEYS)
+    if len(key) == 1
+    for accidental, offset in (("", 0), ("#", 1), ("b", -1))
+}
+
+# frequencies of all MIDI notes, so they don't have to be calculated for every note.
+_MIDI_HZ = tuple(440 * (2 ** ((note - 69) / 12)) for note in range(128))
 
 
 class Pitch:
-    def __init__(self):
-        self.hz = 0.0
+    __slots__ = ("_hz", "_midi")
+
+    def __init__(self, hz: float = 0.0):
+        self.hz = hz
+
+    @classmethod
+    def from_spn(cls, note: str) -> Pitch:
+        """Create a pitch from scientific pitch notation, i.e 'c#4'."""
+
+        pitch = cls()
+        pitch.spn = note
+        return pitch
+
+    @property
+    def hz(self) -> float:
+        return self._hz
+
+    @hz.setter
+    def hz(self, hz: float):
+        self._hz = hz
+        # the note number is worked out again on the next access.
+        self._midi = None
 
     @property
     def midi(self) -> int:
-        return int((12 * math.log2(self.hz / 440)) + 69)
+        if self._midi is None:
+            self._midi = int((12 * math.log2(self._hz / 440)) + 69)
+
+        return self._midi
 
     @midi.setter
     def midi(self, note: int):
-        self.hz = 440 * (2 ** ((note - 69) / 12))
+        if isinstance(note, int) and 0 <= note < len(_MIDI_HZ):
+            self.hz = _MIDI_HZ[note]
+        else:
+            self.hz = 440 * (2 ** ((note - 69) / 12))
+
+        if isinstance(note, int):
+            # the note number is already known, so don't derive it back from hz.
+            self._midi = note
 
     @property
     def spn(self) -> str:
@@ -50,21 +92,80 @@ class Pitch:
 
     @spn.setter
     def spn(self, note: str):
-        key, accidental, octave = RE_NOTE.findall(note)[0]
+        self.midi = _spn_to_midi(note)
+
+
+# scores repeat the same handful of notes, so cache parsed ones.
+@functools.lru_cache(maxsize=256)
+def _spn_to_midi(note: str) -> int:
+    # the accidental, if any, is always right after the key.
+    split = 2 if note[1:2] in ("#", "b") else 1
+    key, octave = note[:split].lower(), note[split:]
+
+    semitone = _KEY_SEMITONES.get(key)
+    if semitone is None or not (octave.isascii() and octave.isdigit()):
+        raise ValueError(f"invalid note: '{note}'")
+
+    return (int(octave) * 12) + semitone
+
+
+class LRUCache:
+    """A cache that holds a limited number of items.
+    Once it is full, the least recently used item is dropped to make room for a new one.
+
+    Args:
+        maxsize: The maximum number of items to hold.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: collections.OrderedDict = collections.OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get an item, marking it as recently used.
+
+        Returns:
+            The item, or default if it isn't in the cache.
+        """
+
+        try:
+            value = self._data[key]
+        except KeyError:
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        """Add an item, dropping the least recently used one if the cache is full."""
+
+        self._data[key] = value
+        self._data.move_to_end(key)
 
-        semitone = (int(octave) * 12) + KEYS.index(key.lower())
-        if accidental == "#":
-            semitone += 1
-        elif accidental == "b":
-            semitone -= 1
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
 
-        self.midi = semitone
 
+def midi_to_hz(notes: np.ndarray) -> np.ndarray:
+    """Convert an array of MIDI note numbers to their frequencies (in hertz) in one go."""
 
+    return 440 * np.exp2((np.asarray(notes) - 69) / 12)
+
+
+@functools.lru_cache(maxsize=4096)
 def srate(wav: Union[str, pathlib.Path]) -> int:
-    """Get the sample rate of a wavfile."""
+    """Get the sample rate of a wavfile.
+    The result is cached, since voicebank samples are looked up many times when rendering.
+    """
 
-    return wave.open(open(wav, "rb")).getframerate()
+    with wave.open(str(wav), "rb") as w:
+        return w.getframerate()
 
 
 def duration(length: int, bpm: int) -> int:
@@ -80,27 +181,40 @@ def duration(length: int, bpm: int) -> int:
     if length not in NOTE_LENGTH:
         return 0
 
-    # There are 60000 miliseconds in a minute.
-    # Since bpm is beats per minute, bpm / 60000 equals the number of beats per milisecond.
-    # Then, we invert to get miliseconds per beat.
-    # Finally, we multiply it by quarter note length / note length,
+    # There are 60000 miliseconds in a minute, so 60000 / bpm is the miliseconds per beat.
+    # Then, we multiply it by quarter note length / note length,
     # because a beat is one quarter note.
+    # Everything is multiplied out first, so this is a single (exact) integer division.
 
-    ms_per_beat = 1 / (bpm / 60000)
-    return int(ms_per_beat * (NOTE_LENGTH.quarter / length))
+    return int((60000 * NOTE_LENGTH.quarter) // (bpm * length))
 
 
 def sine_f0(duration: float, srate: int) -> np.ndarray:
     """Return the f0 contour of a sine wave of duration seconds long."""
 
-    sine_arr = np.sin(2 * np.pi * np.arange(srate * duration) * 440.0 / srate).astype(
-        np.float64
-    )
+    # WORLD needs float64, so build the phase in place and take the sine of it in place.
+    sine_arr = np.arange(srate * duration, dtype=np.float64)
+    sine_arr *= 2 * np.pi * 440.0 / srate
+    np.sin(sine_arr, out=sine_arr)
 
     f0 = pyworld.stonemask(sine_arr, *pyworld.dio(sine_arr, srate), srate)
     return f0
 
 
+# maximum values of integer sample formats, to avoid looking them up with np.iinfo every time.
+_DTYPE_MAX = {
+    np.dtype(dtype): float(np.iinfo(dtype).max)
+    for dtype in ("int8", "int16", "int32", "uint8", "uint16", "uint32")
+}
+
+
+def _dtype_max(dtype: np.dtype) -> float:
+    try:
+        return _DTYPE_MAX[dtype]
+    except KeyError:
+        return float(np.iinfo(dtype).max)
+
+
 def _is_float(dtype):
     return dtype.kind in np.typecodes["AllFloat"]
 
@@ -124,16 +238,18 @@ def scale(arr: np.ndarray, dtype: np.dtype) -> np.ndarray:
         arr = arr.astype(dtype)
 
     else:
-        # scale values
+        # scale values, casting straight into the output array.
         if _is_int(arr.dtype) and _is_float(dtype):
 
-            scale = np.iinfo(arr.dtype).max
-            arr = (arr / scale).astype(dtype)
+            scale = 1 / _dtype_max(arr.dtype)
+            out = np.empty(arr.shape, dtype)
+            arr = np.multiply(arr, scale, out=out, casting="unsafe")
 
         elif _is_float(arr.dtype) and _is_int(dtype):
 
-            scale = np.iinfo(dtype).max
-            arr = (arr * scale).astype(dtype)
+            scale = _dtype_max(dtype)
+            out = np.empty(arr.shape, dtype)
+            arr = np.multiply(arr, scale, out=out, casting="unsafe")
 
     return arr
 
@@ -141,13 +257,11 @@ def scale(arr: np.ndarray, dtype: np.dtype) -> np.ndarray:
 def seg2arr(seg: AudioSegment) -> np.ndarray:
     """Convert an AudioSegment to a numpy array."""
 
-    channels = seg.split_to_mono()
-    samples = [c.get_array_of_samples() for c in channels]
+    # samples are interleaved, so each row is one frame (of all channels).
+    dtype = np.dtype(f"int{seg.sample_width * 8}")
+    arr = np.frombuffer(seg.raw_data, dtype=dtype).reshape(-1, seg.channels)
 
-    arr = np.array(samples).T.astype(np.float64)
-    arr /= np.iinfo(samples[0].typecode).max
-
-    return arr
+    return arr / _dtype_max(dtype)
 
 
 def arr2seg(arr: np.ndarray, srate: int) -> AudioSegment:
@@ -161,5 +275,53 @@ def arr2seg(arr: np.ndarray, srate: int) -> AudioSegment:
         arr.tobytes(),
         frame_rate=srate,
         sample_width=arr.dtype.itemsize,
-        channels=len(arr.shape),
+        channels=arr.shape[1] if arr.ndim > 1 else 1,
     )
+
+
+def resample(seg: AudioSegment, srate: int) -> AudioSegment:
+    """Resample an AudioSegment to another sample rate.
+    Unlike AudioSegment.set_frame_rate(), this uses soxr's (SIMD-accelerated) polyphase filter.
+
+    Args:
+        seg: The segment to resample.
+        srate: The sample rate to resample to.
+
+    Returns:
+        The resampled segment.
+    """
+
+    if seg.frame_rate == srate:
+        return seg
+
+    arr = soxr.resample(seg2arr(seg), seg.frame_rate, srate)
+    # the filter can overshoot slightly, which would wrap around when scaled to ints.
+    np.clip(arr, -1.0, 1.0, out=arr)
+
+    return arr2seg(arr, srate)
+
+
+def join(segments: List[AudioSegment]) -> AudioSegment:
+    """Concatenate several AudioSegments in one go.
+    Chaining '+' copies everything joined so far on each step, but this copies each segment once.
+
+    Args:
+        segments: The segments to join, in order.
+
+    Returns:
+        The joined segment.
+    """
+
+    # match the formats up, like AudioSegment.__add__ does.
+    channels = max(seg.channels for seg in segments)
+    frame_rate = max(seg.frame_rate for seg in segments)
+    sample_width = max(seg.sample_width for seg in segments)
+
+    segments = [
+        seg.set_channels(channels)
+        .set_frame_rate(frame_rate)
+        .set_sample_width(sample_width)
+        for seg in segments
+    ]
+
+    return segments[0]._spawn(b"".join(seg.raw_data for seg in segments))
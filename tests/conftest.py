@@ -0,0 +1,29 @@
+# coding: utf8
+
+import numpy as np
+import pytest
+import soundfile
+
+SYLLABLES = ["ka", "ki", "ku", "ke"]
+
+
+@pytest.fixture
+def voicebank(tmp_path):
+    """A small voicebank of harmonic tones, one per syllable."""
+
+    path = tmp_path / "voicebank"
+    path.mkdir()
+
+    sr = 44100
+    t = np.arange(sr) / sr
+
+    oto = []
+    for count, syllable in enumerate(SYLLABLES):
+        hz = 200 + 15 * count
+        tone = sum(np.sin(2 * np.pi * hz * k * t) / k for k in range(1, 6)) * 0.2
+        soundfile.write(path / f"{syllable}.wav", tone, sr, subtype="PCM_16")
+        oto.append(f"{syllable}.wav={syllable},20,100,50,60,30")
+
+    (path / "oto.ini").write_text("\n".join(oto))
+
+    return path
@@ -0,0 +1,82 @@
+# coding: utf8
+
+import random
+
+from pydub import AudioSegment
+
+from putao import core, model, utau
+
+from conftest import SYLLABLES
+
+
+class PlainResampler(model.Resampler):
+    """Renders notes from the unpitched samples, to keep the tests fast."""
+
+    def pitch(self, note):
+        return AudioSegment.from_wav(note.entry(self.voicebank).path())
+
+
+def render(voicebank):
+    rnd = random.Random(0)
+
+    track = core.Track(PlainResampler(utau.Voicebank(voicebank)))
+    for _ in range(150):
+        if rnd.random() < 0.1:
+            track.rest(rnd.choice([100, 250]))
+        else:
+            track.note(
+                rnd.choice(SYLLABLES), 60, rnd.choice([150, 200, 333, 500])
+            )
+
+    return track.render()
+
+
+def test_settling_does_not_change_render(voicebank, monkeypatch):
+    monkeypatch.setattr(core, "SETTLE_INTERVAL", 10**9)
+    unsettled = render(voicebank)
+
+    monkeypatch.setattr(core, "SETTLE_INTERVAL", 333)
+    settled = render(voicebank)
+
+    assert len(unsettled) > 30000
+    assert settled.raw_data == unsettled.raw_data
+
+
+def test_pitching_is_windowed(voicebank, monkeypatch):
+    monkeypatch.setattr(core, "PITCH_WINDOW", 8)
+
+    batches = []
+
+    class CountingResampler(PlainResampler):
+        def pitch_batch(self, notes):
+            batches.append(len(notes))
+            return super().pitch_batch(notes)
+
+    track = core.Track(CountingResampler(utau.Voicebank(voicebank)))
+    for count in range(40):
+        track.note(SYLLABLES[count % 2], 60, 200)
+
+    track.render()
+
+    # only the first window pitches anything: the rest are already sliced.
+    assert batches == [8]
+
+
+def test_project_workers(voicebank, tmp_path):
+    renders = []
+    for workers in (None, 2):
+        project = core.Project(core.Config(voicebank=str(voicebank), workers=workers))
+        assert project.resampler.workers == workers
+
+        track = project.new_track("lead")
+        for count, syllable in enumerate(SYLLABLES):
+            track.note(syllable, 57 + count, 200)
+
+        path = tmp_path / f"{workers}.wav"
+        project.render(path)
+
+        # worker processes are shut down once the project is rendered.
+        assert project.resampler._executor is None
+        renders.append(AudioSegment.from_wav(path).raw_data)
+
+    assert renders[0] == renders[1]
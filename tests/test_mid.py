@@ -0,0 +1,57 @@
+# coding: utf8
+
+import io
+
+import mido
+
+from putao.source import mid
+
+TPB = 480
+# 120 bpm, so a beat is 500ms.
+TEMPO = 500000
+
+
+def song(messages):
+    midi = mido.MidiFile(ticks_per_beat=TPB)
+    track = mido.MidiTrack([mido.MetaMessage("set_tempo", tempo=TEMPO)])
+    track.extend(messages)
+    midi.tracks.append(track)
+
+    buf = io.BytesIO()
+    midi.save(file=buf)
+    return mid.Song(buf.getvalue())
+
+
+def test_note_on_without_velocity_is_note_off():
+    parsed = song(
+        [
+            mido.Message("note_on", note=60, velocity=64, time=0),
+            mido.Message("note_on", note=60, velocity=0, time=TPB),
+            mido.Message("note_on", note=62, velocity=64, time=0),
+            mido.Message("note_on", note=62, velocity=0, time=TPB),
+        ]
+    )
+
+    assert [(e.start, e.end, e.pitch) for e in parsed.events] == [
+        (0, TPB, 60),
+        (TPB, TPB * 2, 62),
+    ]
+
+
+def test_dump_emits_each_note_once():
+    parsed = song(
+        [
+            mido.Message("note_on", note=60, velocity=64, time=0),
+            mido.Message("note_off", note=60, time=TPB),
+            mido.Message("note_on", note=62, velocity=64, time=TPB // 2),
+            mido.Message("note_off", note=62, time=TPB),
+        ]
+    )
+
+    assert parsed.dump() == {
+        "lead": [
+            {"type": "note", "pitch": 60, "duration": 500},
+            {"type": "rest", "duration": 250},
+            {"type": "note", "pitch": 62, "duration": 500},
+        ]
+    }
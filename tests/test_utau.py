@@ -0,0 +1,82 @@
+# coding: utf8
+
+import os
+import zipfile
+
+from putao import utau
+
+
+def test_parse_alias_with_commas():
+    entry = utau.Entry.parse("ka.wav=- ka, ko,10,20,-30,40,5\n")
+
+    assert entry == utau.Entry("ka.wav", "- ka, ko", 10, 20, -30, 40, 5)
+
+
+def test_parse_blank_entries():
+    # entries with no alias or times fall back to the wavfile's name.
+    for line in ("ka.wav=", "ka.wav=,,,,,", "ka.wav=ka,1,2,3"):
+        assert utau.Entry.parse(line) == utau.Entry("ka.wav", "ka", 0, 0, 0, 0, 0)
+
+
+def test_parse_oto_skips_blank_lines(tmp_path):
+    oto = tmp_path / "oto.ini"
+    oto.write_text("\n\nka.wav=ka,1,2,3,4,5\r\n\r\nki.wav=ki,1,2,3,4,5\n\n", "utf8")
+
+    assert list(utau.parse_oto(oto)) == ["ka", "ki"]
+
+
+def test_editing_oto_invalidates_cache(voicebank):
+    assert utau.Voicebank(voicebank)["ka"].offset == 20
+    assert (voicebank / utau.JSON_CONFIG_FILE).is_file()
+
+    # same size, so only the modification time tells the edit apart.
+    oto = voicebank / utau.CONFIG_FILE
+    stat = oto.stat()
+    oto.write_text(oto.read_text().replace("ka.wav=ka,20", "ka.wav=ka,25"))
+    os.utime(oto, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert utau.Voicebank(voicebank)["ka"].offset == 25
+
+
+def test_extract_converts_newlines(tmp_path):
+    path = tmp_path / "voicebank.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("streamed.ini", "ka\r\nki\rku\n".encode("sjis"))
+        # the start is plain ASCII, so the NEC-only characters after it can only be decoded all at once.
+        zf.writestr(
+            "fallback.ini", ("#" * utau.CHUNK_SIZE + "\r\n①\r\n②\r③\n").encode("cp932")
+        )
+
+    utau.extract(path, tmp_path / "out")
+
+    out = tmp_path / "out"
+    assert (out / "streamed.ini").read_bytes() == b"ka\nki\nku\n"
+    assert (out / "fallback.ini").read_bytes() == (
+        "#" * utau.CHUNK_SIZE + "\n①\n②\n③\n"
+    ).encode("utf8")
+
+
+class ShiftJISInfo(zipfile.ZipInfo):
+    # zipfile always writes non-ASCII names as UTF-8, unlike the tools most voicebanks are zipped with.
+    def _encodeFilenameFlags(self):
+        return self.filename.encode("cp437"), self.flag_bits
+
+
+def test_extract_shift_jis_names(tmp_path):
+    files = {
+        "テト/あ.wav": b"RIFF",
+        "テト/か.wav": b"RIFF",
+        "テト/oto.ini": "あ.wav=あ,1,2,3,4,5\r\n".encode("sjis"),
+    }
+
+    path = tmp_path / "voicebank.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, data in files.items():
+            zf.writestr(ShiftJISInfo(name.encode("sjis").decode("cp437")), data)
+
+    utau.extract(path, tmp_path / "out")
+
+    out = tmp_path / "out"
+    assert (out / "テト" / "あ.wav").read_bytes() == b"RIFF"
+    assert (out / "テト" / "か.wav").read_bytes() == b"RIFF"
+    assert list(utau.parse_oto(out / "テト" / "oto.ini")) == ["あ"]